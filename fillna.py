@@ -3,9 +3,11 @@ from abc import ABC, abstractmethod
 from dataclasses import dataclass
 import datetime
 import dateutil
-from typing import List
+import hashlib
+from typing import Any, Dict, List, Optional
 from cjwmodule.i18n import trans, I18nMessage
 
+import numpy as np
 import pandas as pd
 
 
@@ -50,6 +52,16 @@ def _warn_converted_to_text_because_types_conflict(
     }
 
 
+def _warn_not_filled_because_not_number(colname: str):
+    return {
+        "message": trans(
+            "errors.columnNotNumber",
+            "Column “{colname}” was not filled because it is not a Number column.",
+            {"colname": colname},
+        )
+    }
+
+
 def _workbench_type(series: pd.Series) -> Literal["text", "number", "timestamp"]:
     if pd.api.types.is_numeric_dtype(series):
         return "number"
@@ -65,6 +77,61 @@ def _convert_to_str(series: pd.Series) -> pd.Series:
     return ret
 
 
+def _segmented_fill_indexer(
+    isnull: np.ndarray, group_codes: Optional[np.ndarray], backward: bool
+) -> np.ndarray:
+    """Return, for each row, the position of the row whose value fills it.
+
+    Rows are filled from the nearest non-null row above (or, if `backward`,
+    below) within the same group. A row that is not null -- or that has no
+    non-null row to copy from -- points to itself.
+
+    `group_codes` must be integer group codes (as from `pd.factorize()`), or
+    `None` to treat the whole column as one group. Groups need not be
+    contiguous: if they aren't, we visit rows in a stable sort by group. This
+    is a single NumPy pass; we never split the column into per-group Series.
+    """
+    n = len(isnull)
+    positions = np.arange(n)
+
+    if group_codes is None or n == 0 or (group_codes[1:] >= group_codes[:-1]).all():
+        order = positions
+    else:
+        order = np.argsort(group_codes, kind="mergesort")  # stable
+    if backward:
+        order = order[::-1]
+
+    # last[i]: position (in `order`) of the latest non-null row at or before i
+    last = np.where(isnull[order], -1, positions)
+    np.maximum.accumulate(last, out=last)
+
+    if group_codes is not None and n > 0:
+        # Reset at group boundaries: ignore non-null rows from earlier groups
+        sorted_codes = group_codes[order]
+        is_start = np.empty(n, dtype=bool)
+        is_start[0] = True
+        np.not_equal(sorted_codes[1:], sorted_codes[:-1], out=is_start[1:])
+        group_start = np.maximum.accumulate(np.where(is_start, positions, 0))
+        last[last < group_start] = -1
+
+    source = np.where(last == -1, positions, last)
+    indexer = np.empty(n, dtype=np.intp)
+    indexer[order] = order[source]
+    return indexer
+
+
+def _segmented_fill(
+    series: pd.Series, group_column: pd.Series, backward: bool
+) -> pd.Series:
+    group_codes, _ = pd.factorize(group_column)  # null group => its own group
+    indexer = _segmented_fill_indexer(
+        series.isnull().values, group_codes, backward=backward
+    )
+    ret = series.take(indexer)
+    ret.index = series.index
+    return ret
+
+
 class FillWith(ABC):
     """Abstract class describing how to fill missing values."""
 
@@ -73,15 +140,34 @@ class FillWith(ABC):
         """Return a new `series` with NA values filled in."""
 
     @classmethod
-    def parse(cls, method: str, value: str, from_columns: List[Series]) -> FillWith:
+    def parse(
+        cls,
+        method: str,
+        value: str,
+        from_columns: List[Series],
+        group_column: Optional[Series] = None,
+        time_column: Optional[Series] = None,
+        max_gap: int = 0,
+        extrapolate: bool = False,
+    ) -> FillWith:
         if method == "value":
             return FillValue(value)
         elif method == "pad":
-            return FillPad()
+            return FillPad(group_column)
         elif method == "backfill":
-            return FillBackfill()
+            return FillBackfill(group_column)
         elif method == "columns":
             return FillWithColumns(from_columns)
+        elif method == "mean":
+            return FillMean()
+        elif method == "median":
+            return FillMedian()
+        elif method == "mode":
+            return FillMode()
+        elif method == "linear":
+            return FillInterpolate(None, max_gap, extrapolate)
+        elif method == "time":
+            return FillInterpolate(time_column, max_gap, extrapolate)
         else:
             raise ValueError(f"Invalid method {method}")
 
@@ -140,17 +226,194 @@ class FillValue(FillWith):
 
 
 class FillPad(FillWith):
-    """Operation that fills missing values with previous ones in the Series."""
+    """Operation that fills missing values with previous ones in the Series.
+
+    If `group_column` is set, only copy values from rows in the same group.
+    """
+
+    def __init__(self, group_column: Optional[pd.Series] = None):
+        self.group_column = group_column
 
     def run(self, series: pd.Series):
-        return series.fillna(method="pad"), []
+        if self.group_column is None:
+            return series.fillna(method="pad"), []
+        else:
+            return _segmented_fill(series, self.group_column, backward=False), []
 
 
 class FillBackfill(FillWith):
-    """Operation that fills missing values with next ones in the Series."""
+    """Operation that fills missing values with next ones in the Series.
+
+    If `group_column` is set, only copy values from rows in the same group.
+    """
+
+    def __init__(self, group_column: Optional[pd.Series] = None):
+        self.group_column = group_column
+
+    def run(self, series: pd.Series):
+        if self.group_column is None:
+            return series.fillna(method="backfill"), []
+        else:
+            return _segmented_fill(series, self.group_column, backward=True), []
+
+
+class FillMean(FillWith):
+    """Operation that fills missing numbers with the mean of the others."""
+
+    def run(self, series: pd.Series):
+        isnull = series.isnull().values
+        if not isnull.any():
+            return series, []
+        if _workbench_type(series) != "number":
+            return series, [_warn_not_filled_because_not_number(series.name)]
+
+        n_valid = len(isnull) - np.count_nonzero(isnull)
+        if not n_valid:
+            # All null: there is no mean. No-op.
+            return series, []
+
+        # Sum with nulls as 0, like pandas' nanmean: same float rounding. That
+        # means float32 columns sum in float32.
+        if pd.api.types.is_float_dtype(series):
+            dtype = series.dtype
+        else:
+            dtype = np.dtype(np.float64)
+        total = np.where(isnull, 0, series.values).sum(dtype=dtype)
+        mean = series.dtype.type(total / dtype.type(n_valid))
+        return series.where(~isnull, mean), []
+
+
+class FillMedian(FillWith):
+    """Operation that fills missing numbers with the median of the others."""
+
+    def run(self, series: pd.Series):
+        isnull = series.isnull().values
+        if not isnull.any():
+            return series, []
+        if _workbench_type(series) != "number":
+            return series, [_warn_not_filled_because_not_number(series.name)]
+
+        values = series.values[~isnull]
+        if not len(values):
+            # All null: there is no median. No-op.
+            return series, []
+
+        return series.where(~isnull, np.median(values)), []
+
+
+class FillMode(FillWith):
+    """Operation that fills missing values with the most common other value.
+
+    When several values are equally common, pick the one that appears first.
+    """
 
     def run(self, series: pd.Series):
-        return series.fillna(method="backfill"), []
+        if hasattr(series, "cat"):
+            # Count existing codes; don't hash values
+            codes = series.cat.codes.values
+            uniques = series.cat.categories
+        else:
+            codes, uniques = pd.factorize(series)
+
+        isnull = codes == -1
+        if not isnull.any():
+            return series, []
+
+        valid_codes = codes[~isnull]
+        if not len(valid_codes):
+            # All null: there is no mode. No-op.
+            return series, []
+
+        counts = np.bincount(valid_codes, minlength=len(uniques))
+        is_mode = counts == counts.max()
+        code = valid_codes[np.argmax(is_mode[valid_codes])]  # first to appear
+        return series.where(~isnull, uniques[code]), []
+
+
+class FillInterpolate(FillWith):
+    """Operation that fills missing numbers along a line between neighbors.
+
+    Each null is interpolated between the nearest non-null rows above and
+    below it, weighted by row position -- or, if `time_column` is set, between
+    the nearest non-null rows before and after it in time, weighted by time.
+    Rows with a null time are neither filled nor used as neighbors.
+
+    If `max_gap` is positive, runs of more than `max_gap` nulls stay null. If
+    `extrapolate` is set, nulls before the first value or after the last one
+    are filled by extending the line through the two nearest values.
+    """
+
+    def __init__(
+        self,
+        time_column: Optional[pd.Series] = None,
+        max_gap: int = 0,
+        extrapolate: bool = False,
+    ):
+        self.time_column = time_column
+        self.max_gap = max_gap
+        self.extrapolate = extrapolate
+
+    def run(self, series: pd.Series):
+        isnull = series.isnull().values
+        if not isnull.any():
+            return series, []
+        if _workbench_type(series) != "number":
+            return series, [_warn_not_filled_because_not_number(series.name)]
+
+        if self.time_column is None:
+            rows = np.arange(len(series))
+            x = rows
+        else:
+            times = self.time_column.values.view(np.int64)
+            rows = np.flatnonzero(self.time_column.notnull().values)
+            rows = rows[np.argsort(times[rows], kind="mergesort")]  # stable
+            x = times[rows]
+        # From here on, we work in `rows` order: row order or time order
+        is_target = isnull[rows]
+        is_point = ~is_target
+        n = len(rows)
+
+        point_positions = np.flatnonzero(is_point)
+        if len(point_positions) < 2:
+            # We need two points to draw a line. No-op.
+            return series, []
+
+        # above/below: nearest point above/below (or self, if there is none)
+        above = _segmented_fill_indexer(is_target, None, backward=False)
+        below = _segmented_fill_indexer(is_target, None, backward=True)
+        has_above = is_point[above]
+        has_below = is_point[below]
+
+        fill = is_target & has_above & has_below
+        if self.extrapolate:
+            fill |= is_target
+        if self.max_gap > 0:
+            gap_start = np.where(has_above, above + 1, 0)
+            gap_stop = np.where(has_below, below, n)
+            fill &= gap_stop - gap_start <= self.max_gap
+
+        index = np.flatnonzero(fill)
+        # Draw the line through points a and b. Between points, those are
+        # above and below; past either end, they are the two nearest points.
+        a = np.where(
+            has_below[index],
+            np.where(has_above[index], above[index], point_positions[0]),
+            point_positions[-2],
+        )
+        b = np.where(
+            has_below[index],
+            np.where(has_above[index], below[index], point_positions[1]),
+            point_positions[-1],
+        )
+        y = series.values.astype(np.float64)[rows]
+        # Subtract as int64 before converting: float64 can't hold nanoseconds.
+        # Same arithmetic (and rounding) as np.interp().
+        dx = (x[b] - x[a]).astype(np.float64)
+        slope = np.divide(y[b] - y[a], dx, out=np.zeros(len(index)), where=dx != 0)
+
+        values = series.values.copy()
+        values[rows[index]] = slope * (x[index] - x[a]).astype(np.float64) + y[a]
+        return pd.Series(values, index=series.index, name=series.name), []
 
 
 class FillWithColumns(FillWith):
@@ -217,15 +480,163 @@ def fillna(table: pd.DataFrame, colnames: List[str], fill_with: FillWith) -> Non
     return warnings
 
 
-def render(table, params):
-    fill_with = FillWith.parse(
-        params["method"], params["value"], [table[c] for c in params["from_colnames"]]
-    )
-    warnings = fillna(table, params["colnames"], fill_with)
+_FINGERPRINT_SAMPLE_SIZE = 65536
+
+
+def _input_colnames(params: Dict[str, Any]) -> List[str]:
+    """List the columns whose values can affect the output."""
+    return [
+        *params["colnames"],
+        *params["from_colnames"],
+        *([params["group_colname"]] if params["group_colname"] else []),
+        *([params["time_colname"]] if params["time_colname"] else []),
+    ]
+
+
+def _hash_column(hasher, series: pd.Series, exact: bool) -> None:
+    n = len(series)
+    hasher.update(f"{series.name}\0{series.dtype}\0{n}\0".encode("utf-8"))
+
+    if exact or n <= _FINGERPRINT_SAMPLE_SIZE:
+        rows = slice(None)
+    else:
+        rows = slice(None, None, -(-n // _FINGERPRINT_SAMPLE_SIZE))
+
+    if hasattr(series, "cat"):
+        categories = pd.util.hash_pandas_object(series.cat.categories, index=False)
+        hasher.update(categories.values.tobytes())
+        hasher.update(np.ascontiguousarray(series.cat.codes.values[rows]).tobytes())
+    elif series.dtype == object:
+        # Hash the str objects, not pointers to them: their UTF-8 bytes,
+        # "\0"-separated, plus the null mask.
+        values = series.values[rows]
+        isnull = pd.isnull(values)
+        strs = values[~isnull]
+        try:
+            text = "\0".join(strs)
+        except TypeError:
+            # Not all str. Slower, but handles any object.
+            hasher.update(pd.util.hash_array(values, categorize=False).tobytes())
+        else:
+            hasher.update(isnull.tobytes())
+            if text.count("\0") == max(len(strs) - 1, 0):
+                hasher.update(b"S")
+            else:
+                # Some str contains "\0": add lengths, so the join is unambiguous
+                lengths = np.fromiter(map(len, strs), dtype=np.int64, count=len(strs))
+                hasher.update(b"L" + lengths.tobytes())
+            hasher.update(text.encode("utf-8", "surrogatepass"))
+    else:
+        hasher.update(np.ascontiguousarray(series.values[rows]).tobytes())
+
+
+def fingerprint_table(
+    table: pd.DataFrame, params: Dict[str, Any], exact: bool = True
+) -> str:
+    """Return a digest of the columns `render(table, params)` reads.
+
+    If `exact` is false, columns longer than `_FINGERPRINT_SAMPLE_SIZE` are
+    sampled: a change to an unsampled row will not change the digest. That
+    is fine for a quick "did anything change?" check, but `render()` only
+    reuses output on an exact match.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(str(len(table)).encode("utf-8"))
+    for colname in _input_colnames(params):
+        _hash_column(hasher, table[colname], exact)
+    return hasher.hexdigest()
+
+
+@dataclass(frozen=True)
+class PreviousRender:
+    """What `render()` read and wrote the last time it ran.
+
+    `sampled_fingerprint` and `fingerprint` are `fingerprint_table()` of the
+    input table with `exact=False` and `exact=True`, computed before
+    `render()` modified it. `columns` holds copies of the filled columns.
+    """
+
+    sampled_fingerprint: str
+    fingerprint: str
+    params: Dict[str, Any]
+    columns: Dict[str, Any]
+    warnings: List[Dict[str, Any]]
+
+
+def render(
+    table,
+    params,
+    *,
+    previous: Optional[PreviousRender] = None,
+    return_previous: bool = False,
+):
+    """Fill nulls in `table`.
+
+    If `previous` is from an earlier call with the same params, and the
+    columns we read are unchanged, copy the filled columns from it. We check
+    a sampled fingerprint first, and the exact one only if that matches.
+
+    If `return_previous` is set, return `(result, PreviousRender)` so the
+    caller can pass it as `previous` next time.
+    """
+    # Fingerprint before we modify `table`, and only as much as we need
+    sampled_fingerprint = None
+    fingerprint = None
+
+    def fingerprint_exact():
+        if len(table) <= _FINGERPRINT_SAMPLE_SIZE:
+            return sampled_fingerprint  # nothing was sampled
+        else:
+            return fingerprint_table(table, params)
+
+    reuse = False
+    if previous is not None and previous.params == params:
+        sampled_fingerprint = fingerprint_table(table, params, exact=False)
+        if sampled_fingerprint == previous.sampled_fingerprint:
+            fingerprint = fingerprint_exact()
+            reuse = fingerprint == previous.fingerprint
+
+    if return_previous:
+        if sampled_fingerprint is None:
+            sampled_fingerprint = fingerprint_table(table, params, exact=False)
+        if fingerprint is None:
+            fingerprint = fingerprint_exact()
+
+    if params["method"] == "time" and not params["time_colname"]:
+        # User hasn't chosen a time column yet. No-op.
+        warnings = []
+    elif reuse:
+        # The columns we read are unchanged: copy the columns we wrote
+        for colname in params["colnames"]:
+            table[colname] = previous.columns[colname].copy()
+        warnings = previous.warnings
+    else:
+        fill_with = FillWith.parse(
+            params["method"],
+            params["value"],
+            [table[c] for c in params["from_colnames"]],
+            table[params["group_colname"]] if params["group_colname"] else None,
+            table[params["time_colname"]] if params["time_colname"] else None,
+            params["max_gap"],
+            params["extrapolate"],
+        )
+        warnings = fillna(table, params["colnames"], fill_with)
+
     if warnings:
-        return table, warnings
+        result = table, warnings
+    else:
+        result = table
+
+    if return_previous:
+        return result, PreviousRender(
+            sampled_fingerprint,
+            fingerprint,
+            params,
+            {colname: table[colname].values.copy() for colname in params["colnames"]},
+            warnings,
+        )
     else:
-        return table
+        return result
 
 
 def _migrate_params_v0_to_v1(params):
@@ -260,9 +671,32 @@ def _migrate_params_v1_to_v2(params):
     }
 
 
+def _migrate_params_v2_to_v3(params):
+    """v2: No "group_colname" choice. v3 has one."""
+    return {
+        **params,
+        "group_colname": "",
+    }
+
+
+def _migrate_params_v3_to_v4(params):
+    """v3: No interpolation options. v4 has "time_colname", "max_gap" and
+    "extrapolate"."""
+    return {
+        **params,
+        "time_colname": "",
+        "max_gap": 0,
+        "extrapolate": False,
+    }
+
+
 def migrate_params(params):
     if "contenttype" in params:
         params = _migrate_params_v0_to_v1(params)
     if "from_colnames" not in params:
         params = _migrate_params_v1_to_v2(params)
+    if "group_colname" not in params:
+        params = _migrate_params_v2_to_v3(params)
+    if "time_colname" not in params:
+        params = _migrate_params_v3_to_v4(params)
     return params
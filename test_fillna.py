@@ -1,18 +1,33 @@
 from typing import Any, Dict, List
 import unittest
+from unittest.mock import patch
 import pandas as pd
 from pandas.testing import assert_frame_equal
 import numpy as np
-from fillna import migrate_params, render
+import fillna
+from fillna import PreviousRender, fingerprint_table, migrate_params, render
 from cjwmodule.testing.i18n import cjwmodule_i18n_message, i18n_message
 
 
-def P(colnames=[], method="value", value="", from_colnames=[]):
+def P(
+    colnames=[],
+    method="value",
+    value="",
+    from_colnames=[],
+    group_colname="",
+    time_colname="",
+    max_gap=0,
+    extrapolate=False,
+):
     return {
         "colnames": colnames,
         "method": method,
         "value": value,
         "from_colnames": from_colnames,
+        "group_colname": group_colname,
+        "time_colname": time_colname,
+        "max_gap": max_gap,
+        "extrapolate": extrapolate,
     }
 
 
@@ -32,6 +47,10 @@ class MigrateParamsTest(unittest.TestCase):
                 "method": "value",
                 "value": "",
                 "from_colnames": [],
+                "group_colname": "",
+                "time_colname": "",
+                "max_gap": 0,
+                "extrapolate": False,
             },
         )
 
@@ -50,6 +69,10 @@ class MigrateParamsTest(unittest.TestCase):
                 "method": "value",
                 "value": "x",
                 "from_colnames": [],
+                "group_colname": "",
+                "time_colname": "",
+                "max_gap": 0,
+                "extrapolate": False,
             },
         )
 
@@ -68,6 +91,10 @@ class MigrateParamsTest(unittest.TestCase):
                 "method": "pad",
                 "value": "",
                 "from_colnames": [],
+                "group_colname": "",
+                "time_colname": "",
+                "max_gap": 0,
+                "extrapolate": False,
             },
         )
 
@@ -86,6 +113,10 @@ class MigrateParamsTest(unittest.TestCase):
                 "method": "backfill",
                 "value": "",
                 "from_colnames": [],
+                "group_colname": "",
+                "time_colname": "",
+                "max_gap": 0,
+                "extrapolate": False,
             },
         )
 
@@ -103,6 +134,10 @@ class MigrateParamsTest(unittest.TestCase):
                 "method": "backfill",
                 "value": "x",
                 "from_colnames": [],
+                "group_colname": "",
+                "time_colname": "",
+                "max_gap": 0,
+                "extrapolate": False,
             },
         )
 
@@ -120,6 +155,81 @@ class MigrateParamsTest(unittest.TestCase):
                 "method": "backfill",
                 "value": "x",
                 "from_colnames": [],
+                "group_colname": "",
+                "time_colname": "",
+                "max_gap": 0,
+                "extrapolate": False,
+            },
+        )
+
+    def test_v3(self):
+        self.assertEqual(
+            migrate_params(
+                {
+                    "colnames": ["A"],
+                    "method": "backfill",
+                    "value": "x",
+                    "from_colnames": ["B"],
+                }
+            ),
+            {
+                "colnames": ["A"],
+                "method": "backfill",
+                "value": "x",
+                "from_colnames": ["B"],
+                "group_colname": "",
+                "time_colname": "",
+                "max_gap": 0,
+                "extrapolate": False,
+            },
+        )
+
+    def test_v3_keep_group_colname(self):
+        self.assertEqual(
+            migrate_params(
+                {
+                    "colnames": ["A"],
+                    "method": "backfill",
+                    "value": "x",
+                    "from_colnames": [],
+                    "group_colname": "B",
+                }
+            ),
+            {
+                "colnames": ["A"],
+                "method": "backfill",
+                "value": "x",
+                "from_colnames": [],
+                "group_colname": "B",
+                "time_colname": "",
+                "max_gap": 0,
+                "extrapolate": False,
+            },
+        )
+
+    def test_v4(self):
+        self.assertEqual(
+            migrate_params(
+                {
+                    "colnames": ["A"],
+                    "method": "time",
+                    "value": "x",
+                    "from_colnames": [],
+                    "group_colname": "",
+                    "time_colname": "T",
+                    "max_gap": 2,
+                    "extrapolate": True,
+                }
+            ),
+            {
+                "colnames": ["A"],
+                "method": "time",
+                "value": "x",
+                "from_colnames": [],
+                "group_colname": "",
+                "time_colname": "T",
+                "max_gap": 2,
+                "extrapolate": True,
             },
         )
 
@@ -308,6 +418,299 @@ class TestRender(unittest.TestCase):
             pd.DataFrame({"A": [2.2, 2.2, np.nan]}, dtype=float),
         )
 
+    def test_fill_with_previous_in_sorted_groups(self):
+        self._test(
+            pd.DataFrame(
+                {
+                    "A": [1.1, np.nan, np.nan, 4.4, np.nan],
+                    "G": ["a", "a", "b", "b", "b"],
+                }
+            ),
+            P(["A"], "pad", group_colname="G"),
+            pd.DataFrame(
+                {
+                    "A": [1.1, 1.1, np.nan, 4.4, 4.4],
+                    "G": ["a", "a", "b", "b", "b"],
+                }
+            ),
+        )
+
+    def test_fill_with_previous_in_unsorted_groups(self):
+        self._test(
+            pd.DataFrame(
+                {
+                    "A": ["x", "y", None, None, None],
+                    "G": [1, 2, 1, 3, 2],
+                }
+            ),
+            P(["A"], "pad", group_colname="G"),
+            pd.DataFrame(
+                {
+                    "A": ["x", "y", "x", None, "y"],
+                    "G": [1, 2, 1, 3, 2],
+                }
+            ),
+        )
+
+    def test_fill_with_next_in_unsorted_groups(self):
+        self._test(
+            pd.DataFrame(
+                {
+                    "A": pd.Series(
+                        [None, None, "2020-01-02", None, "2020-01-01"],
+                        dtype="datetime64[ns]",
+                    ),
+                    "G": ["a", "b", "a", "a", "b"],
+                }
+            ),
+            P(["A"], "backfill", group_colname="G"),
+            pd.DataFrame(
+                {
+                    "A": pd.Series(
+                        ["2020-01-02", "2020-01-01", "2020-01-02", None, "2020-01-01"],
+                        dtype="datetime64[ns]",
+                    ),
+                    "G": ["a", "b", "a", "a", "b"],
+                }
+            ),
+        )
+
+    def test_fill_with_previous_in_groups_categorical(self):
+        self._test(
+            pd.DataFrame(
+                {
+                    "A": pd.Series(["x", None, "y", None], dtype="category"),
+                    "G": pd.Series(["a", "b", "b", "a"], dtype="category"),
+                }
+            ),
+            P(["A"], "pad", group_colname="G"),
+            pd.DataFrame(
+                {
+                    "A": pd.Series(["x", None, "y", "x"], dtype="category"),
+                    "G": pd.Series(["a", "b", "b", "a"], dtype="category"),
+                }
+            ),
+        )
+
+    def test_fill_with_previous_null_group_is_a_group(self):
+        self._test(
+            pd.DataFrame(
+                {"A": [1.1, np.nan, 3.3, np.nan], "G": ["a", None, None, "a"]}
+            ),
+            P(["A"], "pad", group_colname="G"),
+            pd.DataFrame({"A": [1.1, np.nan, 3.3, 1.1], "G": ["a", None, None, "a"]}),
+        )
+
+    def test_fill_with_mean(self):
+        self._test(
+            pd.DataFrame({"A": [1.0, np.nan, 2.0, np.nan, 6.0]}),
+            P(["A"], "mean"),
+            pd.DataFrame({"A": [1.0, 3.0, 2.0, 3.0, 6.0]}),
+        )
+
+    def test_fill_with_mean_keeps_dtype(self):
+        self._test(
+            pd.DataFrame({"A": [1.0, np.nan, 2.0]}, dtype=np.float32),
+            P(["A"], "mean"),
+            pd.DataFrame({"A": [1.0, 1.5, 2.0]}, dtype=np.float32),
+        )
+
+    def test_fill_with_mean_all_null(self):
+        self._test(
+            pd.DataFrame({"A": [np.nan, np.nan]}),
+            P(["A"], "mean"),
+            pd.DataFrame({"A": [np.nan, np.nan]}),
+        )
+
+    def test_fill_with_mean_text_is_not_filled(self):
+        self._test(
+            pd.DataFrame({"A": ["a", None]}),
+            P(["A"], "mean"),
+            pd.DataFrame({"A": ["a", None]}),
+            [{"message": i18n_message("errors.columnNotNumber", {"colname": "A"})}],
+        )
+
+    def test_fill_with_median(self):
+        self._test(
+            pd.DataFrame({"A": [1.0, np.nan, 2.0, np.nan, 6.0, 100.0]}),
+            P(["A"], "median"),
+            pd.DataFrame({"A": [1.0, 4.0, 2.0, 4.0, 6.0, 100.0]}),
+        )
+
+    def test_fill_with_median_timestamp_is_not_filled(self):
+        self._test(
+            pd.DataFrame(
+                {"A": pd.Series(["2020-01-01", None], dtype="datetime64[ns]")}
+            ),
+            P(["A"], "median"),
+            pd.DataFrame(
+                {"A": pd.Series(["2020-01-01", None], dtype="datetime64[ns]")}
+            ),
+            [{"message": i18n_message("errors.columnNotNumber", {"colname": "A"})}],
+        )
+
+    def test_fill_with_mode_text_tie_picks_first(self):
+        self._test(
+            pd.DataFrame({"A": ["b", None, "a", "a", "b", None]}),
+            P(["A"], "mode"),
+            pd.DataFrame({"A": ["b", "b", "a", "a", "b", "b"]}),
+        )
+
+    def test_fill_with_mode_number(self):
+        self._test(
+            pd.DataFrame({"A": [1.0, np.nan, 2.0, 2.0]}),
+            P(["A"], "mode"),
+            pd.DataFrame({"A": [1.0, 2.0, 2.0, 2.0]}),
+        )
+
+    def test_fill_with_mode_timestamp(self):
+        self._test(
+            pd.DataFrame(
+                {
+                    "A": pd.Series(
+                        ["2020-01-01", None, "2020-01-02", "2020-01-02"],
+                        dtype="datetime64[ns]",
+                    )
+                }
+            ),
+            P(["A"], "mode"),
+            pd.DataFrame(
+                {
+                    "A": pd.Series(
+                        ["2020-01-01", "2020-01-02", "2020-01-02", "2020-01-02"],
+                        dtype="datetime64[ns]",
+                    )
+                }
+            ),
+        )
+
+    def test_fill_with_mode_categorical(self):
+        self._test(
+            pd.DataFrame(
+                {
+                    "A": pd.Categorical(
+                        ["b", None, "a", "a", "b"], categories=["a", "b", "c"]
+                    )
+                }
+            ),
+            P(["A"], "mode"),
+            pd.DataFrame(
+                {
+                    "A": pd.Categorical(
+                        ["b", "b", "a", "a", "b"], categories=["a", "b", "c"]
+                    )
+                }
+            ),
+        )
+
+    def test_interpolate_linear(self):
+        self._test(
+            pd.DataFrame({"A": [np.nan, 1.0, np.nan, np.nan, 4.0, np.nan]}),
+            P(["A"], "linear"),
+            pd.DataFrame({"A": [np.nan, 1.0, 2.0, 3.0, 4.0, np.nan]}),
+        )
+
+    def test_interpolate_linear_extrapolate(self):
+        self._test(
+            pd.DataFrame({"A": [np.nan, 1.0, np.nan, 5.0, np.nan, np.nan]}),
+            P(["A"], "linear", extrapolate=True),
+            pd.DataFrame({"A": [-1.0, 1.0, 3.0, 5.0, 7.0, 9.0]}),
+        )
+
+    def test_interpolate_linear_max_gap(self):
+        self._test(
+            pd.DataFrame({"A": [0.0, np.nan, 2.0, np.nan, np.nan, 5.0, np.nan]}),
+            P(["A"], "linear", max_gap=1, extrapolate=True),
+            pd.DataFrame({"A": [0.0, 1.0, 2.0, np.nan, np.nan, 5.0, 6.0]}),
+        )
+
+    def test_interpolate_linear_one_value_is_noop(self):
+        self._test(
+            pd.DataFrame({"A": [np.nan, 1.0, np.nan]}),
+            P(["A"], "linear", extrapolate=True),
+            pd.DataFrame({"A": [np.nan, 1.0, np.nan]}),
+        )
+
+    def test_interpolate_text_is_not_filled(self):
+        self._test(
+            pd.DataFrame({"A": ["a", None, "b"]}),
+            P(["A"], "linear"),
+            pd.DataFrame({"A": ["a", None, "b"]}),
+            [{"message": i18n_message("errors.columnNotNumber", {"colname": "A"})}],
+        )
+
+    def test_interpolate_time(self):
+        self._test(
+            pd.DataFrame(
+                {
+                    "A": [1.0, np.nan, np.nan, 5.0, np.nan],
+                    "T": pd.Series(
+                        [
+                            "2020-01-01",
+                            "2020-01-02",
+                            None,
+                            "2020-01-05",
+                            "2020-01-06",
+                        ],
+                        dtype="datetime64[ns]",
+                    ),
+                }
+            ),
+            P(["A"], "time", time_colname="T", extrapolate=True),
+            pd.DataFrame(
+                {
+                    "A": [1.0, 2.0, np.nan, 5.0, 6.0],
+                    "T": pd.Series(
+                        [
+                            "2020-01-01",
+                            "2020-01-02",
+                            None,
+                            "2020-01-05",
+                            "2020-01-06",
+                        ],
+                        dtype="datetime64[ns]",
+                    ),
+                }
+            ),
+        )
+
+    def test_interpolate_time_unsorted(self):
+        self._test(
+            pd.DataFrame(
+                {
+                    "A": [1.0, np.nan, 3.0, np.nan],
+                    "T": pd.Series(
+                        ["2020-01-02", "2020-01-01", "2020-01-04", "2020-01-03"],
+                        dtype="datetime64[ns]",
+                    ),
+                }
+            ),
+            P(["A"], "time", time_colname="T"),
+            pd.DataFrame(
+                {
+                    "A": [1.0, np.nan, 3.0, 2.0],
+                    "T": pd.Series(
+                        ["2020-01-02", "2020-01-01", "2020-01-04", "2020-01-03"],
+                        dtype="datetime64[ns]",
+                    ),
+                }
+            ),
+        )
+
+    def test_interpolate_time_without_time_column_is_noop(self):
+        self._test(
+            pd.DataFrame({"A": [1.0, np.nan, 3.0]}),
+            P(["A"], "time"),
+            pd.DataFrame({"A": [1.0, np.nan, 3.0]}),
+        )
+
+    def test_interpolate_keeps_dtype(self):
+        self._test(
+            pd.DataFrame({"A": [1.0, np.nan, 3.0]}, dtype=np.float32),
+            P(["A"], "linear"),
+            pd.DataFrame({"A": [1.0, 2.0, 3.0]}, dtype=np.float32),
+        )
+
     def test_fill_with_columns_empty(self):
         self._test(
             pd.DataFrame({"A": [1, np.nan, 2]}),
@@ -486,5 +889,169 @@ class TestRender(unittest.TestCase):
         )
 
 
+class FingerprintTest(unittest.TestCase):
+    def test_ignore_unused_columns(self):
+        table = pd.DataFrame({"A": [1.0, np.nan], "B": ["x", "y"], "C": [1, 2]})
+        params = P(["A"], "columns", from_colnames=["B"])
+        fingerprint = fingerprint_table(table, params)
+        table["C"] = [3, 4]
+        self.assertEqual(fingerprint_table(table, params), fingerprint)
+
+    def test_change_used_columns(self):
+        table = pd.DataFrame(
+            {
+                "A": [1.0, np.nan],
+                "B": pd.Series(["x", "y"], dtype="category"),
+                "T": pd.Series(["2020-01-01", None], dtype="datetime64[ns]"),
+            }
+        )
+        params = P(["A"], "time", group_colname="B", time_colname="T")
+        fingerprint = fingerprint_table(table, params)
+        for colname, values in [
+            ("A", [1.0, 2.0]),
+            ("B", pd.Series(["x", "z"], dtype="category")),
+            ("T", pd.Series(["2020-01-01", "2020-01-02"], dtype="datetime64[ns]")),
+        ]:
+            with self.subTest(colname=colname):
+                table2 = table.copy()
+                table2[colname] = values
+                self.assertNotEqual(fingerprint_table(table2, params), fingerprint)
+
+    def test_change_text(self):
+        params = P(["A"], "value", "x")
+        self.assertNotEqual(
+            fingerprint_table(pd.DataFrame({"A": ["a", None]}), params),
+            fingerprint_table(pd.DataFrame({"A": ["b", None]}), params),
+        )
+
+    def test_change_text_containing_separator(self):
+        params = P(["A"], "value", "x")
+        self.assertNotEqual(
+            fingerprint_table(pd.DataFrame({"A": ["a\0", "b", None]}), params),
+            fingerprint_table(pd.DataFrame({"A": ["a", "\0b", None]}), params),
+        )
+
+    def test_change_text_with_non_str(self):
+        params = P(["A"], "value", "x")
+        self.assertNotEqual(
+            fingerprint_table(pd.DataFrame({"A": ["a", 1, None]}), params),
+            fingerprint_table(pd.DataFrame({"A": ["a", 2, None]}), params),
+        )
+
+    def test_sample_large_column_only_if_not_exact(self):
+        n = fillna._FINGERPRINT_SAMPLE_SIZE * 2
+        table = pd.DataFrame({"A": np.arange(n, dtype=float)})
+        params = P(["A"], "pad")
+        sampled = fingerprint_table(table, params, exact=False)
+        exact = fingerprint_table(table, params)
+        table.loc[1, "A"] = np.nan  # an unsampled row
+        self.assertEqual(fingerprint_table(table, params, exact=False), sampled)
+        self.assertNotEqual(fingerprint_table(table, params), exact)
+
+
+class RenderPreviousTest(unittest.TestCase):
+    def _previous(self, table, params, columns, warnings=[]):
+        return PreviousRender(
+            fingerprint_table(table, params, exact=False),
+            fingerprint_table(table, params),
+            params,
+            columns,
+            warnings,
+        )
+
+    def test_reuse_output_when_inputs_unchanged(self):
+        params = P(["A"], "value", "x")
+        table = pd.DataFrame({"A": [np.nan, 1.0], "B": [1, 2]})
+        previous = self._previous(
+            table,
+            params,
+            # Not what render would output: proves it is reused
+            {"A": np.array(["reused", "1.0"], dtype=object)},
+            [{"message": "previous warning"}],
+        )
+        table["B"] = [3, 4]
+        result = render(table, params, previous=previous)
+        assert_frame_equal(
+            result[0], pd.DataFrame({"A": ["reused", "1.0"], "B": [3, 4]})
+        )
+        self.assertEqual(result[1], [{"message": "previous warning"}])
+
+    def test_rerender_when_inputs_changed(self):
+        params = P(["A"], "value", "2.0")
+        table = pd.DataFrame({"A": [np.nan, 1.0]})
+        previous = self._previous(table, params, {"A": np.array([2.0, 1.0])})
+        table["A"] = [np.nan, 3.0]
+        result = render(table, params, previous=previous)
+        assert_frame_equal(result, pd.DataFrame({"A": [2.0, 3.0]}))
+
+    def test_rerender_when_unsampled_row_changed(self):
+        n = 200000
+        params = P(["A"], "pad")
+        table = pd.DataFrame({"A": np.arange(n, dtype=float)})
+        table.loc[2, "A"] = np.nan
+        _, previous = render(table.copy(), params, return_previous=True)
+
+        table.loc[1, "A"] = 99.0  # not sampled by fingerprint_table(exact=False)
+        result = render(table, params, previous=previous)
+        self.assertEqual(result["A"][1], 99.0)
+        self.assertEqual(result["A"][2], 99.0)
+
+    def test_skip_exact_fingerprint_when_sampled_differs(self):
+        n = 200000
+        params = P(["A"], "pad")
+        table = pd.DataFrame({"A": np.arange(n, dtype=float)})
+        _, previous = render(table.copy(), params, return_previous=True)
+        table.loc[0, "A"] = np.nan  # a sampled row
+        with patch.object(
+            fillna, "fingerprint_table", wraps=fillna.fingerprint_table
+        ) as fingerprint:
+            render(table, params, previous=previous)
+        fingerprint.assert_called_once_with(table, params, exact=False)
+
+    def test_skip_fingerprint_when_params_changed(self):
+        params = P(["A"], "value", "2.0")
+        table = pd.DataFrame({"A": [np.nan, 1.0]})
+        previous = self._previous(table, params, {"A": np.array([2.0, 1.0])})
+        with patch.object(fillna, "fingerprint_table") as fingerprint:
+            result = render(table, P(["A"], "value", "3.0"), previous=previous)
+        fingerprint.assert_not_called()
+        assert_frame_equal(result, pd.DataFrame({"A": [3.0, 1.0]}))
+
+    def test_return_previous(self):
+        params = P(["A"], "value", "2.0")
+        table = pd.DataFrame({"A": [np.nan, 1.0], "B": [1, 2]})
+        expected = self._previous(table, params, {"A": np.array([2.0, 1.0])})
+        result, previous = render(table, params, return_previous=True)
+        assert_frame_equal(result, pd.DataFrame({"A": [2.0, 1.0], "B": [1, 2]}))
+        self.assertEqual(previous.sampled_fingerprint, expected.sampled_fingerprint)
+        self.assertEqual(previous.fingerprint, expected.fingerprint)
+        self.assertEqual(previous.params, params)
+        self.assertEqual(list(previous.columns), ["A"])  # not "B"
+        np.testing.assert_array_equal(previous.columns["A"], [2.0, 1.0])
+        self.assertEqual(previous.warnings, [])
+
+    def test_return_previous_after_reuse(self):
+        params = P(["A"], "value", "x")
+        table = pd.DataFrame({"A": [np.nan, 1.0]})
+        _, previous = render(table.copy(), params, return_previous=True)
+        (result, warnings), previous2 = render(
+            table.copy(), params, previous=previous, return_previous=True
+        )
+        assert_frame_equal(result, pd.DataFrame({"A": ["x", "1.0"]}))
+        self.assertEqual(previous2.fingerprint, previous.fingerprint)
+        self.assertEqual(previous2.sampled_fingerprint, previous.sampled_fingerprint)
+        self.assertEqual(previous2.warnings, warnings)
+
+    def test_editing_result_does_not_change_previous(self):
+        params = P(["A"], "value", "2.0")
+        table = pd.DataFrame({"A": [np.nan, 1.0]})
+        result, previous = render(table.copy(), params, return_previous=True)
+        result["A"].values[0] = 100.0
+        result2 = render(table.copy(), params, previous=previous)
+        result2["A"].values[0] = 200.0
+        result3 = render(table.copy(), params, previous=previous)
+        assert_frame_equal(result3, pd.DataFrame({"A": [2.0, 1.0]}))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,326 @@
+"""Differential tests: optimized fill engines vs. the plain-pandas reference.
+
+Each case generates a random table and random params, and runs the same
+fill twice: once through a reference `FillWith` built from plain pandas
+calls, and once through the engine `fillna.py` actually uses. Output tables and warnings
+must be exactly equal. We record how long each side takes, so a change
+that makes an engine slower shows up next to the correctness results.
+
+To gate a new engine, add it to `CASES` next to its reference. `FillValue`
+and `FillWithColumns` have no alternative engine yet: their cases compare
+each class with itself, so that a new engine can replace the candidate.
+`_convert_to_str()` is only covered through those classes.
+"""
+
+from collections import defaultdict
+import sys
+import time
+from typing import Any, Callable, Dict, List, NamedTuple
+import unittest
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+from fillna import (
+    FillBackfill,
+    FillValue,
+    FillWithColumns,
+    FillInterpolate,
+    FillMean,
+    FillMedian,
+    FillMode,
+    FillPad,
+    FillWith,
+    _warn_not_filled_because_not_number,
+    fillna,
+)
+
+N_RANDOM_TABLES = 200
+BIG_N_ROWS = 20000
+
+
+def _random_values(random: np.random.RandomState, n_rows: int) -> pd.Series:
+    kind = random.choice(["number", "float32", "int", "text", "category", "timestamp"])
+    null_fraction = random.choice([0.0, 0.1, 0.5, 0.9, 1.0])
+    isnull = random.random_sample(n_rows) < null_fraction
+    n_distinct = random.randint(1, 10)
+    ints = random.randint(0, n_distinct, n_rows)
+
+    if kind == "int":
+        return pd.Series(ints)  # ints can't be null
+    elif kind in {"number", "float32"}:
+        values = ints + random.random_sample(n_rows).round(2)
+        values[isnull] = np.nan
+        return pd.Series(values, dtype=np.float64 if kind == "number" else np.float32)
+    elif kind == "timestamp":
+        values = (ints * 86400 * 10**9).astype("datetime64[ns]")
+        values[isnull] = np.datetime64("NaT")
+        return pd.Series(values)
+    else:
+        values = pd.Series(["v%d" % i for i in ints], dtype=object)
+        values[isnull] = None
+        if kind == "category":
+            values = values.astype("category")
+        return values
+
+
+def _random_group_values(random: np.random.RandomState, n_rows: int) -> pd.Series:
+    n_groups = random.randint(1, max(2, min(n_rows // 3, 100)))
+    codes = random.randint(0, n_groups, n_rows)
+    if random.random_sample() < 0.5:
+        codes.sort()  # exercise the already-grouped path
+    values = pd.Series(["g%d" % i for i in codes], dtype=object)
+    values[random.random_sample(n_rows) < 0.1] = None  # null groups
+    if random.random_sample() < 0.5:
+        values = values.astype("category")
+    return values
+
+
+def random_table(random: np.random.RandomState, n_rows: int) -> pd.DataFrame:
+    n_columns = random.randint(1, 4)
+    table = pd.DataFrame(
+        {"C%d" % i: _random_values(random, n_rows) for i in range(n_columns)}
+    )
+    table["G"] = _random_group_values(random, n_rows)
+    table["T"] = _random_time_values(random, n_rows)
+    return table
+
+
+def _random_time_values(random: np.random.RandomState, n_rows: int) -> pd.Series:
+    days = random.permutation(n_rows * 2)[:n_rows]  # distinct times
+    if random.random_sample() < 0.5:
+        days.sort()
+    values = (days * 86400 * 10**9).astype("datetime64[ns]")
+    values[random.random_sample(n_rows) < 0.1] = np.datetime64("NaT")
+    return pd.Series(values)
+
+
+def random_params(random: np.random.RandomState, table: pd.DataFrame) -> Dict[str, Any]:
+    value_colnames = [c for c in table.columns if c not in {"G", "T"}]
+    return {
+        "colnames": [c for c in value_colnames if random.random_sample() < 0.7],
+        "from_colnames": [c for c in value_colnames if random.random_sample() < 0.5],
+        # "" is null for numbers and timestamps; timestamps drop the timezone
+        "value": random.choice(["", "x", "v1", "3.5", "2020-01-02T03:04+01:00"]),
+        "time_colname": "T" if random.random_sample() < 0.5 else "",
+        "max_gap": random.choice([0, 1, 2, 5]),
+        "extrapolate": bool(random.random_sample() < 0.5),
+    }
+
+
+def _time_column(table: pd.DataFrame, params: Dict[str, Any]):
+    return table[params["time_colname"]] if params["time_colname"] else None
+
+
+class ReferenceFillWithinGroups(FillWith):
+    """Apply an ungrouped `FillWith` to each group's rows, one group at a time."""
+
+    def __init__(self, fill_with: FillWith, group_column: pd.Series):
+        self.fill_with = fill_with
+        self.group_column = group_column
+
+    def run(self, series: pd.Series):
+        codes, _ = pd.factorize(self.group_column)
+        ret = series.copy()
+        for code in np.unique(codes):
+            mask = codes == code
+            filled, _ = self.fill_with.run(series[mask])
+            ret[mask] = filled
+        return ret, []
+
+
+class ReferencePad(FillWith):
+    def run(self, series: pd.Series):
+        return series.fillna(method="pad"), []
+
+
+class ReferenceBackfill(FillWith):
+    def run(self, series: pd.Series):
+        return series.fillna(method="backfill"), []
+
+
+class ReferenceMean(FillWith):
+    def run(self, series: pd.Series):
+        if not series.isnull().any():
+            return series, []
+        if not pd.api.types.is_numeric_dtype(series):
+            return series, [_warn_not_filled_because_not_number(series.name)]
+        if series.isnull().all():
+            return series, []
+        return series.fillna(series.mean()), []
+
+
+class ReferenceMedian(FillWith):
+    def run(self, series: pd.Series):
+        if not series.isnull().any():
+            return series, []
+        if not pd.api.types.is_numeric_dtype(series):
+            return series, [_warn_not_filled_because_not_number(series.name)]
+        if series.isnull().all():
+            return series, []
+        return series.fillna(series.median()), []
+
+
+class ReferenceMode(FillWith):
+    def run(self, series: pd.Series):
+        if not series.isnull().any() or series.isnull().all():
+            return series, []
+        counts = series.value_counts()
+        modes = counts.index[counts == counts.max()]
+        value = series[series.isin(modes)].iloc[0]
+        return series.fillna(value), []
+
+
+class ReferenceInterpolate(FillWith):
+    """Series.interpolate(), plus max_gap and extrapolate done with pandas ops.
+
+    With a time column, interpolate over a DatetimeIndex sorted by time.
+    """
+
+    def __init__(self, time_column=None, max_gap=0, extrapolate=False):
+        self.time_column = time_column
+        self.max_gap = max_gap
+        self.extrapolate = extrapolate
+
+    def run(self, series: pd.Series):
+        if not series.isnull().any():
+            return series, []
+        if not pd.api.types.is_numeric_dtype(series):
+            return series, [_warn_not_filled_because_not_number(series.name)]
+
+        if self.time_column is None:
+            ordered = series.reset_index(drop=True)
+            x = np.arange(len(series))
+            method = "linear"
+        else:
+            times = self.time_column[self.time_column.notnull()]
+            times = times.sort_values(kind="mergesort")
+            ordered = series[times.index]
+            ordered.index = pd.DatetimeIndex(times.values)
+            x = times.values.view(np.int64)
+            method = "time"
+        if ordered.count() < 2:
+            return series, []
+
+        filled = ordered.interpolate(method=method, limit_area="inside").values
+        isnull = ordered.isnull().values
+
+        if self.extrapolate:
+            points = np.flatnonzero(~isnull)
+            y = ordered.values.astype(np.float64)
+            positions = np.arange(len(ordered))
+            for target, (a, b) in [
+                (positions < points[0], points[:2]),
+                (positions > points[-1], points[-2:]),
+            ]:
+                slope = (y[b] - y[a]) / float(x[b] - x[a])
+                filled[target] = slope * (x[target] - x[a]).astype(np.float64) + y[a]
+
+        if self.max_gap > 0:
+            run_ids = np.cumsum(~isnull)
+            run_lengths = pd.Series(isnull).groupby(run_ids).transform("sum").values
+            filled[isnull & (run_lengths > self.max_gap)] = np.nan
+
+        ret = series.copy()
+        if self.time_column is None:
+            ret[:] = filled
+        else:
+            ret[times.index] = filled
+        return ret, []
+
+
+class Case(NamedTuple):
+    name: str
+    reference: Callable[[pd.DataFrame, Dict[str, Any]], FillWith]
+    candidate: Callable[[pd.DataFrame, Dict[str, Any]], FillWith]
+
+
+CASES: List[Case] = [
+    # Ungrouped pad/backfill _is_ Series.fillna(); only grouped uses our kernel
+    Case(
+        "grouped pad",
+        lambda t, p: ReferenceFillWithinGroups(ReferencePad(), t["G"]),
+        lambda t, p: FillPad(t["G"]),
+    ),
+    Case(
+        "grouped backfill",
+        lambda t, p: ReferenceFillWithinGroups(ReferenceBackfill(), t["G"]),
+        lambda t, p: FillBackfill(t["G"]),
+    ),
+    Case(
+        "value", lambda t, p: FillValue(p["value"]), lambda t, p: FillValue(p["value"])
+    ),
+    Case(
+        "columns",
+        lambda t, p: FillWithColumns([t[c] for c in p["from_colnames"]]),
+        lambda t, p: FillWithColumns([t[c] for c in p["from_colnames"]]),
+    ),
+    Case("mean", lambda t, p: ReferenceMean(), lambda t, p: FillMean()),
+    Case("median", lambda t, p: ReferenceMedian(), lambda t, p: FillMedian()),
+    Case("mode", lambda t, p: ReferenceMode(), lambda t, p: FillMode()),
+    Case(
+        "interpolate",
+        lambda t, p: ReferenceInterpolate(
+            _time_column(t, p), p["max_gap"], p["extrapolate"]
+        ),
+        lambda t, p: FillInterpolate(
+            _time_column(t, p), p["max_gap"], p["extrapolate"]
+        ),
+    ),
+]
+
+
+class DifferentialTest(unittest.TestCase):
+    timings = defaultdict(list)  # case name => [candidate_time / reference_time]
+
+    @classmethod
+    def tearDownClass(cls):
+        for name, ratios in cls.timings.items():
+            print(
+                "%s: candidate/reference time, median %.3f, max %.3f (%d tables)"
+                % (name, np.median(ratios), np.max(ratios), len(ratios)),
+                file=sys.stderr,
+            )
+
+    def _run_case(
+        self, case: Case, table: pd.DataFrame, params: Dict[str, Any]
+    ) -> None:
+        colnames = params["colnames"]
+
+        reference_table = table.copy()
+        start = time.perf_counter()
+        reference_warnings = fillna(
+            reference_table, colnames, case.reference(reference_table, params)
+        )
+        reference_time = time.perf_counter() - start
+
+        candidate_table = table.copy()
+        start = time.perf_counter()
+        candidate_warnings = fillna(
+            candidate_table, colnames, case.candidate(candidate_table, params)
+        )
+        candidate_time = time.perf_counter() - start
+
+        assert_frame_equal(candidate_table, reference_table, check_exact=True)
+        self.assertEqual(candidate_warnings, reference_warnings)
+        self.timings[case.name].append(candidate_time / max(reference_time, 1e-9))
+
+    def test_random_tables(self):
+        random = np.random.RandomState(0)
+        for seed in range(N_RANDOM_TABLES):
+            table = random_table(random, random.randint(0, 30))
+            for case in CASES:
+                params = random_params(random, table)
+                with self.subTest(seed=seed, case=case.name, params=params):
+                    self._run_case(case, table, params)
+
+    def test_big_table(self):
+        random = np.random.RandomState(1)
+        table = random_table(random, BIG_N_ROWS)
+        for case in CASES:
+            params = random_params(random, table)
+            with self.subTest(case=case.name, params=params):
+                self._run_case(case, table, params)
+
+
+if __name__ == "__main__":
+    unittest.main()